@@ -1,18 +1,27 @@
 """
 Wrapper around pyan to create call graph and dependcy dotfiles.
 """
+from concurrent.futures import ProcessPoolExecutor
 import pyan
 import sys
 
-outfile = sys.argv[1]
-module_files = sys.argv[2:]
 
-callgraph = pyan.create_callgraph(module_files, format='dot', draw_defines=False, nested_groups=False, grouped=False)
+def create_callgraph(module_files, grouped):
+    """ Runs pyan on the module files, returns the dot graph. """
+    return pyan.create_callgraph(module_files, format='dot', draw_defines=False, nested_groups=grouped, grouped=grouped)
 
-with open(f"flow_{outfile}", 'w') as f:
-    f.write(callgraph)
 
-callgraph = pyan.create_callgraph(module_files, format='dot', draw_defines=False, nested_groups=True, grouped=True)
+if __name__ == '__main__':
+    outfile = sys.argv[1]
+    module_files = sys.argv[2:]
 
-with open(f"grouped_{outfile}", 'w') as f:
-    f.write(callgraph)
+    # The two analyses are independent, run them in parallel.
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        flow = executor.submit(create_callgraph, module_files, False)
+        grouped = executor.submit(create_callgraph, module_files, True)
+
+        with open(f"flow_{outfile}", 'w') as f:
+            f.write(flow.result())
+
+        with open(f"grouped_{outfile}", 'w') as f:
+            f.write(grouped.result())
@@ -1,73 +1,217 @@
 """
-Memory cache functions for kodi addon.
+Memory (and disk) cache functions for kodi addon.
 
 The window property from kodi has the ability to accept arbitrary data as a "property".
 This interface is used to store (key: val) pairs as a property of the kodi HOME window:
 
-    a) addon id + hash(locale + parameter_string): json_data
+    a) addon id + hash(addon version + locale + parameter_string): json_data
         key: language specific hash of the parameters passed to the the addon.
+             Including the version discards listings cached by another addon version.
         val: json data required to create a specific kodi listing.
 
-    b) addon-id-cache-ids: CSV
+    b) addon-id-cache-ids: count
         key: static, addon-specific string
-        val: A CSV list of all keys from a) with data stored.
+        val: The number of keys from a) with data stored.
+
+    c) addon-id-cache-ids-<n>: cache id
+        key: static, addon-specific string numbered from 0 to count - 1
+        val: The n-th key from a) with data stored.
+
+Storing each key from a) as its own property makes adding a key constant time.
+
+The json data is also written through to a file named after the cache id in the
+addon profile directory. On a memory cache miss (eg. after kodi restarts) the file is
+used if it is younger than the user configured lifetime, and copied back into memory.
+Expired files are removed at most once an hour, the time of which is stored as the
+addon-id-cache-pruned property.
 """
 
-from hashlib import blake2s
+from hashlib import blake2b
 import json
+import os
+from threading import Lock
+import time
 
 import xbmcgui
 
-from resources.lib.kodi import get_addon_id
+from resources.lib.kodi import get_addon_id, get_addon_version, get_cache_path, get_setting
 from resources.lib.logger import log
 
+# Minimum number of seconds between removing the expired files from the disk cache.
+_PRUNE_INTERVAL = 3600
+
+# Guards the count of cached ids, as listings are also cached from prefetch threads.
+_CACHED_IDS_LOCK = Lock()
+
+
+def get_cached_count(memcache):
+    """ Returns the number of ids stored in the memory cache. """
+    try:
+        return int(memcache.getProperty(get_cache_key()) or 0)
+    except ValueError:
+        return 0
+
 
 def get_cache_key():
-    """ The master id used to store the CSV list of cached ids. """
+    """ The master id used to store the count of cached ids, and prefix of the numbered ids. """
     return f"{get_addon_id()}-cache-ids"
 
 
+def get_prune_key():
+    """ The id used to store the time the disk cache was last pruned. """
+    return f"{get_addon_id()}-cache-pruned"
+
+
 def get_cache_id(param_string):
     """ Creates hash of the parameter string to use (with addon id) as the cache id. """
-    id_hash = blake2s(param_string.encode("utf-8", "surrogateescape")).hexdigest()[0:10]
+    key = get_addon_version() + param_string
+    id_hash = blake2b(key.encode("utf-8", "surrogateescape"), digest_size=5).hexdigest()
     return f"{get_addon_id()}-{id_hash}"
 
 
+def get_disk_ttl():
+    """ Lifetime of the disk cache files in seconds, zero if disabled. """
+    try:
+        return int(get_setting("cache_disk_ttl_hours")) * 3600
+    except ValueError:
+        return 0
+
+
+def get_cache_filepath(cache_id):
+    """ On disk path of the file storing the data for cache_id. """
+    cache_dir = get_cache_path().encode("utf-8", "surrogateescape")
+    return os.path.join(cache_dir, cache_id.encode("utf-8", "surrogateescape") + b".json")
+
+
+def write_disk_data(cache_id, cache_data):
+    """ Writes the json data to the disk cache. """
+    filepath = get_cache_filepath(cache_id)
+    tmp_filepath = filepath + b".tmp"
+
+    try:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(tmp_filepath, "w", encoding="utf-8", errors="surrogateescape") as file:
+            file.write(cache_data)
+        # Atomic, so an interrupted write never leaves a truncated cache file.
+        os.replace(tmp_filepath, filepath)
+    except OSError as err:
+        log("Failed to write %s to disk cache: %s", cache_id, err)
+
+
+def read_disk_data(cache_id):
+    """ Reads the json data from the disk cache, if the cache file exists and has not expired. """
+    ttl = get_disk_ttl()
+    if not ttl:
+        return ""
+
+    filepath = get_cache_filepath(cache_id)
+
+    try:
+        if time.time() - os.path.getmtime(filepath) > ttl:
+            os.remove(filepath)
+            return ""
+        with open(filepath, "r", encoding="utf-8", errors="surrogateescape") as file:
+            return file.read()
+    except OSError:
+        return ""
+
+
+def erase_disk(max_age=None):
+    """ Removes all files from the disk cache, or only files older than max_age seconds. """
+    cache_dir = get_cache_path().encode("utf-8", "surrogateescape")
+    now = time.time()
+
+    try:
+        filenames = os.listdir(cache_dir)
+    except OSError:
+        return
+
+    for filename in filenames:
+        filepath = os.path.join(cache_dir, filename)
+        try:
+            if max_age is None or now - os.path.getmtime(filepath) > max_age:
+                os.remove(filepath)
+        except OSError as err:
+            log("Failed to remove %s from disk cache: %s", filename, err)
+
+
+def prune_disk(memcache):
+    """
+    Removes the files of expired (or orphaned) listings from the disk cache, or all files
+    if the disk cache is disabled. Runs at most once per _PRUNE_INTERVAL, as it checks every file.
+    """
+    prune_key = get_prune_key()
+    now = time.time()
+
+    try:
+        pruned = float(memcache.getProperty(prune_key) or 0)
+    except ValueError:
+        pruned = 0
+
+    if now - pruned < _PRUNE_INTERVAL:
+        return
+
+    memcache.setProperty(prune_key, str(now))
+    erase_disk(get_disk_ttl())
+
+
 def erase():
-    """ Clears all cached results from the memory cache. """
+    """ Clears all cached results from the memory and disk cache. """
     memcache = xbmcgui.Window(10000)
-    cache_id_key = get_cache_key()
-    cache_id_list = memcache.getProperty(cache_id_key)[1:].split(",")
+    cache_key = get_cache_key()
 
-    for _id in cache_id_list:
-        memcache.clearProperty(_id)
-    memcache.clearProperty(cache_id_key)
+    with _CACHED_IDS_LOCK:
+        for index in range(get_cached_count(memcache)):
+            memcache.clearProperty(memcache.getProperty(f"{cache_key}-{index}"))
+            memcache.clearProperty(f"{cache_key}-{index}")
+        memcache.clearProperty(cache_key)
+    memcache.clearProperty(get_prune_key())
+
+    erase_disk()
+
+
+def add_memory_data(memcache, cache_id, cache_data):
+    """ Adds the json data to the memory cache. """
+    memcache.setProperty(cache_id, cache_data)
+    log("Added %s to cache.", cache_id)
+
+    # Add the cache_id as the next numbered id, which is itself stored in the cache.
+    cache_key = get_cache_key()
+    with _CACHED_IDS_LOCK:
+        count = get_cached_count(memcache)
+        memcache.setProperty(f"{cache_key}-{count}", cache_id)
+        memcache.setProperty(cache_key, str(count + 1))
+    log("Number of cached ids: %s", count + 1)
 
 
 def add_data(param_string, content, content_type):
-    """ Adds a json object to the memory cache. """
+    """ Adds a json object to the memory cache and the disk cache. """
     memcache = xbmcgui.Window(10000)
     cache_id = get_cache_id(param_string)
     cache_data = json.dumps((content, content_type))
-    memcache.setProperty(cache_id, cache_data)
-    log(f"Added {cache_id} to cache.")
+    add_memory_data(memcache, cache_id, cache_data)
+
+    if get_disk_ttl():
+        write_disk_data(cache_id, cache_data)
 
-    # Add the cache_id to a CSV list of cached ids, which is itself stored in the cache.
-    cache_id_key = get_cache_key()
-    cache_id_list = memcache.getProperty(cache_id_key)
-    cache_id_list += ("," + cache_id)
-    log(f"List of cached ids: {cache_id_list}")
-    memcache.setProperty(cache_id_key, cache_id_list)
+    # Keep the cache directory from growing.
+    prune_disk(memcache)
 
 
 def get_data(param_string):
-    """ Retrieve json object from memory cache.  """
+    """ Retrieve json object from memory cache, or the disk cache if not in memory.  """
     memcache = xbmcgui.Window(10000)
     cache_id = get_cache_id(param_string)
     cached_data = memcache.getProperty(cache_id)
-    log(f'Cache data {cache_id} exists: {cached_data != ""}')
+    log("Cache data %s exists: %s", cache_id, cached_data != "")
 
     if not cached_data:
-        return None
+        cached_data = read_disk_data(cache_id)
+        log("Disk cache data %s exists: %s", cache_id, cached_data != "")
+
+        if not cached_data:
+            return None
+
+        add_memory_data(memcache, cache_id, cached_data)
 
     return json.loads(cached_data)
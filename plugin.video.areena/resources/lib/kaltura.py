@@ -43,7 +43,6 @@ Example ["sources"] entry
 """
 
 import json
-import re
 from resources.lib.logger import log
 from resources.lib.misc import extract_suffix
 
@@ -88,11 +87,11 @@ def get_api_payload(entry_id):
     }
 
 
-def get_hd_mpd_stream_manifest(site, mode):
-    """ Selects highest quality stream manifest from kaltura. """
-    log(f"Kaltura stream flavors:{json.dumps(site.json(), indent=2)}")
+def get_hd_mpd_stream_manifest(json_data, mode):
+    """ Selects highest quality stream manifest from the decoded kaltura response. """
+    log(lambda: f"Kaltura stream flavors:{json.dumps(json_data, indent=2)}")
 
-    sources = site.json()[1]["sources"]
+    sources = json_data[1]["sources"]
 
     if mode == "live":
         target_stream = 16231
@@ -107,12 +106,15 @@ def get_hd_mpd_stream_manifest(site, mode):
 
     if mode == "download":
         # strip all flavors except the last one, which should be 1080p.
-        manifest = re.sub("[0-9][^,/]+,", "", manifest)
+        # eg. .../flavorIds/1_abc,1_def,1_xyz/... -> .../flavorIds/1_xyz/...
+        last_sep = manifest.rfind(",")
+        if last_sep != -1:
+            manifest = manifest[:manifest.rfind("/", 0, last_sep) + 1] + manifest[last_sep + 1:]
 
     return manifest
 
 
-def get_subtitles(site):
+def get_subtitles(json_data):
     """ Extracts all language subtitles and crafts the direct download url. """
-    subs = site.json()[1]["playbackCaptions"]
+    subs = json_data[1]["playbackCaptions"]
     return {f'.{c.get("label")}-{c.get("languageCode")}.sub': get_subtitle_url(c.get("url")) for c in subs}
@@ -4,6 +4,7 @@ Used to check settings, perform search, create listings, play media.
 """
 import sys
 
+from functools import lru_cache
 from urllib.parse import urlencode
 
 import xbmc
@@ -13,35 +14,87 @@ import xbmcplugin
 import xbmcvfs
 
 
+# Addon instance shared by all calls within a single addon invocation.
+_ADDON = None
+
+# Kodi interface language the cached translations are in.
+_GUI_LANGUAGE = None
+
+
+def get_addon():
+    """ Lazily created xbmcaddon.Addon instance of this kodi addon. """
+    global _ADDON
+    if _ADDON is None:
+        _ADDON = xbmcaddon.Addon()
+    return _ADDON
+
+
+def reload_addon():
+    """
+    Drops the cached addon instance and settings, and the translations if kodi language changed.
+    The language invoker is reused between calls (see addon.xml), so module state persists.
+    Call once per invocation so that changed settings are picked up.
+    """
+    global _ADDON, _GUI_LANGUAGE
+    _ADDON = None
+    get_setting.cache_clear()
+
+    gui_language = xbmc.getLanguage()
+    if gui_language != _GUI_LANGUAGE:
+        _GUI_LANGUAGE = gui_language
+        localize.cache_clear()
+
+
 def get_addon_handle():
     """ Integer identifier of this kodi addon. """
     return int(sys.argv[1])
 
 
+@lru_cache(maxsize=None)
 def get_addon_id():
     """ URL identifier of this kodi addon: eg "plugin.video.xyz". """
-    return xbmcaddon.Addon().getAddonInfo("id")
+    return get_addon().getAddonInfo("id")
+
+
+@lru_cache(maxsize=None)
+def get_addon_version():
+    """ Version string of this kodi addon: eg "1.2.0". """
+    return get_addon().getAddonInfo("version")
 
 
+@lru_cache(maxsize=None)
 def get_icon_path(filename):
     """ On disk path of kodi addon resource. """
-    addon_path = xbmcaddon.Addon().getAddonInfo("path")
+    addon_path = get_addon().getAddonInfo("path")
     return xbmcvfs.translatePath(addon_path + f'resources/media/{filename}')
 
 
+def get_cache_path():
+    """ On disk directory for the listing cache, in the addon profile directory. """
+    profile_path = get_addon().getAddonInfo("profile")
+    return xbmcvfs.translatePath(profile_path + "cache/")
+
+
+@lru_cache(maxsize=32)
 def get_setting(label):
     """ Get the value from addon settings. """
-    return xbmcaddon.Addon().getSetting(label)
+    return get_addon().getSetting(label)
 
 
 def open_settings():
     """ Opens the addon settings. """
-    xbmcaddon.Addon().openSettings()
+    get_addon().openSettings()
 
 
+@lru_cache(maxsize=None)
 def localize(translation_id):
     """ Translate text to GLOBAL kodi language setting (not addon setting). """
-    return xbmcaddon.Addon().getLocalizedString(translation_id)
+    return get_addon().getLocalizedString(translation_id)
+
+
+def get_gui_language():
+    """ GLOBAL kodi interface language (not addon setting), which localize() translates to. """
+    return _GUI_LANGUAGE or xbmc.getLanguage()
 
 
 def get_user_input(heading):
@@ -56,7 +109,7 @@ def get_download_path():
 
 def send_notification(status, msg):
     """ Send a popup alert notification to the kodi interface. """
-    icon = xbmcaddon.Addon().getAddonInfo("icon")
+    icon = get_addon().getAddonInfo("icon")
     xbmc.executebuiltin(f"Notification({status} ,{msg}, 5000, {icon})")
 
 
@@ -99,34 +152,33 @@ def create_EEXIST_popup(filename):
     return choice[res]
 
 
-def create_list_item_info(title, attrs):
-    """ Adds metadata to a video item (playable or series folder) """
-    return {"sorttitle": title, "plot": attrs.get("description"), "duration": attrs.get("duration")}
-
-
-def create_list_item_video_title(name, attrs):
+def create_list_item_video_title(name, attrs, labels):
     """ Creates title name for video in kodi interface. """
     prefix = ""
 
     # requires python >= 3.8
     # if (season := attrs.get("season")):
-    if attrs.get("season"):
-        season = attrs.get("season")
-        prefix += f"{localize(33028)} {season} "
+    season = attrs.get("season")
+    if season:
+        prefix += f"{labels['season']} {season} "
 
     # requires python >= 3.8
     # if (episode := attrs.get("episode")):
-    if attrs.get("episode"):
-        episode = attrs.get("episode")
-        prefix += f"{localize(33029)} {episode} "
+    episode = attrs.get("episode")
+    if episode:
+        prefix += f"{labels['episode']} {episode} "
 
     return prefix + name
 
 
+def create_param_string(attrs):
+    """ URL encodes the attrs dictionary, as the parameters the addon is called back with. """
+    return urlencode(attrs, encoding="utf-8", errors="surrogateescape")
+
+
 def create_callback_url(attrs):
     """ Create plugin recursive callback URL, with attrs dictionary as parameters. """
-    param_string = urlencode(attrs, encoding="utf-8", errors="surrogateescape")
-    return f"plugin://{get_addon_id()}/?{param_string}"
+    return f"plugin://{get_addon_id()}/?{create_param_string(attrs)}"
 
 
 def create_colored_label(title, color):
@@ -141,51 +193,53 @@ def create_list_item(title, color, attrs):
 
     # Set the video properties for media or folders containing media.
     if attrs:
-        list_item.setInfo("video", create_list_item_info(title.encode("utf-8", "surrogateescape"), attrs))
+        list_item.setInfo("video", {"sorttitle": title.encode("utf-8", "surrogateescape"),
+                                    "plot": attrs.get("description"),
+                                    "duration": attrs.get("duration")})
 
     return list_item
 
 
-def create_list_item_media(_type, name, color, item, url):
+def create_list_item_media(_type, name, color, item, labels):
     """ Creates list item for playable media in the kodi interface. """
 
-    title = create_list_item_video_title(name, item)
+    title = create_list_item_video_title(name, item, labels)
     list_item = create_list_item(title, color, item)
 
     # Mark the video as playable.
     list_item.setProperty("IsPlayable", "true")
 
     # Don't enable download option for live streams or local videos.
-    if _type in ["live", "video"]:
+    if _type in {"live", "video"}:
         return list_item
 
     # Create a download callback event for the vod stream.
-    api_data = item.get("api_data")
-    api_data["type"] = "download"
+    # From a copy of api_data, as the item is also cached for later listings.
     # Format the filename for saving to the filesystem
-    api_data["filename"] = title.strip().replace("/", ":")
-    url = create_callback_url(api_data)
+    download_data = {**item.get("api_data"), "type": "download",
+                     "filename": title.strip().replace("/", ":")}
+    url = create_callback_url(download_data)
 
     # Create a "Download" button in the context menu.
-    list_item.addContextMenuItems([(localize(33039), f"RunPlugin({url})")])
+    list_item.addContextMenuItems([(labels["download"], f"RunPlugin({url})")])
 
     return list_item
 
 
-def create_list_entry(item, colors):
+def create_list_entry(item, colors, labels):
     """ Creates the appropriate listing entries for provided item. """
     api_data = item.get("api_data")
     _type = api_data.get("type")
     name = item.get("name")
     url = create_callback_url(api_data)
 
-    if _type in ["search", "settings"]:
+    if _type in {"search", "settings"}:
         is_folder = False
         list_item = create_list_item(name, colors["title"], attrs=None)
 
-    elif _type in ["program", "live", "clip", "video"]:
+    elif _type in {"program", "live", "clip", "video"}:
         is_folder = False
-        list_item = create_list_item_media(_type, name, colors["title"], item, url)
+        list_item = create_list_item_media(_type, name, colors["title"], item, labels)
 
     else: # [category, subcategory, series, package].
         is_folder = True
@@ -206,9 +260,11 @@ def create_listing(content, content_type):
 
     # Get colors here instead of calling get_setting() for each item.
     colors = {"title": get_setting("title_color"), "folder": get_setting("folder_color")}
+    # Likewise for the translated labels used in media item titles and menus.
+    labels = {"season": localize(33028), "episode": localize(33029), "download": localize(33039)}
 
     # Generate the listing items.
-    listing = [create_list_entry(item, colors) for item in content]
+    listing = [create_list_entry(item, colors, labels) for item in content]
     # Add our listing to Kodi.
     xbmcplugin.addDirectoryItems(_handle, listing, len(listing))
 
@@ -241,12 +297,19 @@ def new_search():
         xbmc.executebuiltin(f"Container.Update({url}, replace)")
 
 
+@lru_cache(maxsize=4)
+def encode_headers(header_items):
+    """ URL encodes the (hashable) tuple of HTTP header items. """
+    return urlencode(header_items)
+
+
 def play_media_stream(url, stream_format, headers):
     """ Opens the url (with inputstream adaptive if not a local file) to play the media. """
     _handle = get_addon_handle()
 
     if headers:
-        headers = urlencode(headers)
+        # The same static headers are reused for every stream.
+        headers = encode_headers(tuple(headers.items()))
         # Affix the headers twice: to the URL (ffmpeg), and for inputstream.adaptive
         # This ensures the headers will be affixed if a different inputstreamer is used.
         url = f"{url}|{headers}"
@@ -257,7 +320,8 @@ def play_media_stream(url, stream_format, headers):
     # Try to use inputstream adaptive for network stream playback.
     if stream_format:
         play_item.setProperty("inputstream", "inputstream.adaptive")
-        play_item.setProperty("inputstream.adaptive.stream_headers", headers)
+        if headers:
+            play_item.setProperty("inputstream.adaptive.stream_headers", headers)
         play_item.setProperty("inputstream.adaptive.manifest_type", stream_format)
 
     xbmcplugin.setResolvedUrl(_handle, True, listitem=play_item)
@@ -7,7 +7,33 @@ import xbmc
 from resources.lib.kodi import get_setting, get_addon_id
 
 
-def log(msg):
-    """ Log something to the kodi.log file """
-    if get_setting("debug") == "true":
+# Debug setting, read on first use within an addon invocation.
+_DEBUG = None
+
+
+def reload_debug_setting():
+    """ Forces the debug setting to be read again on the next log call. """
+    global _DEBUG
+    _DEBUG = None
+
+
+def debug_enabled():
+    """ Whether debug logging is enabled in the addon settings. """
+    global _DEBUG
+    if _DEBUG is None:
+        _DEBUG = get_setting("debug") == "true"
+    return _DEBUG
+
+
+def log(msg, *args):
+    """
+    Log something to the kodi.log file.
+    Optional args are %-formatted into msg, only when debug logging is enabled.
+    msg can also be a callable returning the message, which is only called when enabled.
+    """
+    if debug_enabled():
+        if callable(msg):
+            msg = msg()
+        if args:
+            msg = msg % args
         xbmc.log(msg=f"{get_addon_id()}, {msg}", level=xbmc.LOGDEBUG)
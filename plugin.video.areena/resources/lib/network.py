@@ -2,65 +2,193 @@
 Network interface functions: fetch url response and download files.
 """
 
-from random import randint
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import os
+from random import randrange
+from threading import Lock
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from resources.lib.logger import log
 
 
+# HTTP session shared by all requests: keeps connections to yle and kaltura alive.
+# The connection pool is sized for the concurrent requests, and failed connections are retried.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32,
+                                       max_retries=Retry(total=2, backoff_factor=0.2)))
+
+# Seconds to wait for the server to connect or send data, before giving up on a request.
+_TIMEOUT = 10
+
+# HTTP session for speculative requests: no retries and a short timeout,
+# so a slow server does not hold up the user's next request.
+_PREFETCH_SESSION = requests.Session()
+_PREFETCH_TIMEOUT = 3
+
+# HTTP headers shared by all requests, created on first use.
+_HEADERS = None
+
+# Size of the chunks a download is read and written in.
+_CHUNK_SIZE = 1024**2
+# Amount of a download written between dropping it from the page cache.
+_DROP_CACHE_SIZE = 64 * 1024**2
+
+# Requests currently in progress: (url, body) key to the future of their response.
+_IN_FLIGHT = {}
+_IN_FLIGHT_LOCK = Lock()
+
+
 def random_elisa_ipv4():
     """
     Generates an Finnish IP address from 91.152.0.0/13.
     (Excluding the ~2k IPs ending with .0 or .255)
     """
-    return f"91.15{randint(2,9)}.{randint(0,255)}.{randint(1,254)}"
+    # A single draw, split into the 8 second, 256 third and 254 last octet values.
+    second, rest = divmod(randrange(8 * 256 * 254), 256 * 254)
+    third, last = divmod(rest, 254)
+    return f"91.{152 + second}.{third}.{last + 1}"
 
 
 def get_http_headers():
-    """ HTTP headers used for yle and kaltura api requests. """
-    tbb_user_agent = "Mozilla/5.0 (Windows NT 10.0; rv:91.0) Gecko/20100101 Firefox/91.0"
-    url = "https://areena.yle.fi"
-    return {"User-Agent": tbb_user_agent,
-            "X-Forwarded-For": random_elisa_ipv4(),
-            "Referer": url,
-            "Origin": url}
+    """ HTTP headers used for yle and kaltura api requests. Do not modify the returned dict. """
+    global _HEADERS
+    if _HEADERS is None:
+        tbb_user_agent = "Mozilla/5.0 (Windows NT 10.0; rv:91.0) Gecko/20100101 Firefox/91.0"
+        url = "https://areena.yle.fi"
+        _HEADERS = {"User-Agent": tbb_user_agent,
+                    "X-Forwarded-For": random_elisa_ipv4(),
+                    "Referer": url,
+                    "Origin": url}
+    return _HEADERS
+
+
+def reset_http_headers():
+    """ Discards the shared headers, so the next request uses a new forwarded IP address. """
+    global _HEADERS
+    _HEADERS = None
 
 
 def get_url_response(url, body=None):
+    """
+    Performs HTTP request to provided url and returns response.
+    Concurrent identical requests are coalesced: the callers share one response.
+    """
+    key = (url, json.dumps(body, sort_keys=True) if body else None)
+
+    with _IN_FLIGHT_LOCK:
+        future = _IN_FLIGHT.get(key)
+        in_progress = future is not None
+        if not in_progress:
+            future = _IN_FLIGHT[key] = Future()
+
+    # Wait for the thread already performing this request.
+    if in_progress:
+        return future.result()
+
+    try:
+        res = fetch_url_response(url, body)
+    except BaseException as err:
+        future.set_exception(err)
+        raise
+    else:
+        future.set_result(res)
+        return res
+    finally:
+        with _IN_FLIGHT_LOCK:
+            del _IN_FLIGHT[key]
+
+
+def fetch_url_response(url, body=None, session=_SESSION, timeout=_TIMEOUT):
     """ Performs HTTP request to provided url and returns response. """
     headers = get_http_headers()
-    log(f"Accessing url: {url}")
+    log("Accessing url: %s", url)
 
     if body:
-        res = requests.post(url, headers=headers, json=body)
+        res = session.post(url, headers=headers, json=body, timeout=timeout)
 
     else:
-        res = requests.get(url, headers=headers)
+        res = session.get(url, headers=headers, timeout=timeout)
 
-    log(f"Response headers: {res.headers}")
+    log("Response headers: %s", res.headers)
+    # Request refused (eg. geo-blocked or rate limited): try another address next time.
+    if res.status_code in (403, 429):
+        reset_http_headers()
     res.raise_for_status()
 
     return res
 
 
+def prefetch_url_response(url):
+    """ Performs a speculative HTTP request to provided url, giving up quickly, and returns response. """
+    return fetch_url_response(url, session=_PREFETCH_SESSION, timeout=_PREFETCH_TIMEOUT)
+
+
+def get_url_responses(urls, max_workers=8):
+    """ Performs concurrent HTTP requests to the provided urls and returns the responses in order. """
+    if not urls:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(get_url_response, urls))
+
+
 def download_file(url, path, offset):
     """ Downloads a file to the filesystem. """
-    headers = get_http_headers()
-    log(f"Accessing url: {url}")
+    headers = dict(get_http_headers())
+    log("Accessing url: %s", url)
 
     # File partially exists, resume download.
     if offset:
         headers["Range"] = f"bytes={offset}-"
 
-    res = requests.get(url, allow_redirects=True, headers=headers, stream=True)
-    log(f"Response headers: {res.headers}")
+    res = _SESSION.get(url, allow_redirects=True, headers=headers, stream=True, timeout=_TIMEOUT)
+    log("Response headers: %s", res.headers)
     # The response will be 416 if attempting to resume a completed download.
     if res.status_code == 416:
         return
 
     res.raise_for_status()
+    # Let urllib3 undo any gzip/deflate transfer encoding while reading the raw stream.
+    res.raw.decode_content = True
 
     with open(path.encode("utf-8", "surrogateescape"), "ab") as file:
-        for chunk in res.iter_content(chunk_size=1024**2):
+        # Start of the data not yet dropped from the page cache.
+        cached_start = file.tell()
+
+        for chunk in iter(lambda: res.raw.read(_CHUNK_SIZE), b""):
             file.write(chunk)
+
+            if file.tell() - cached_start >= _DROP_CACHE_SIZE:
+                cached_start = drop_page_cache(file, cached_start)
+
+        drop_page_cache(file, cached_start)
+
+
+def drop_page_cache(file, start):
+    """
+    Writes the file data from start to the disk and drops it from the page cache (where supported),
+    so a large download does not evict data used by kodi, eg. for playback.
+    Only written back data can be dropped, hence the sync. Returns the end of the dropped data.
+    """
+    file.flush()
+    end = file.tell()
+
+    if hasattr(os, "posix_fadvise") and hasattr(os, "fdatasync"):
+        os.fdatasync(file.fileno())
+        os.posix_fadvise(file.fileno(), start, end - start, os.POSIX_FADV_DONTNEED)
+
+    return end
+
+
+def download_files(downloads, max_workers=4):
+    """ Concurrently downloads (url, path) pairs to the filesystem, from the start of each file. """
+    if not downloads:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(downloads))) as executor:
+        # Consume the results to raise any download errors.
+        list(executor.map(lambda download: download_file(*download, offset=0), downloads))
@@ -29,16 +29,20 @@ These are extracted from the yle json. eg 1_ab12xy
 For each step 1-3 if the results exist in the memory cache, they are used.
 If they don't exist, the results are cached for subsequent access.
 This reduces latency of navigating by limiting repetitive network requests.
-The cache lives only in RAM and is cleared on kodi exit, or through the addon settings.
+The cache lives in RAM and is cleared on kodi exit, or through the addon settings.
+It is also written to disk and reused after kodi restarts, until the files expire
+(lifetime set in the addon settings) or the cache is cleared through the addon settings.
 
 """
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import json
 
 from urllib.parse import parse_qsl
 
-from resources.lib.logger import log
+from resources.lib.logger import log, reload_debug_setting
 from resources.lib.misc import mkdict
-from resources.lib.network import download_file, get_http_headers, get_url_response
+from resources.lib.network import download_file, download_files, get_http_headers, get_url_response, get_url_responses, prefetch_url_response
 from resources.lib import cache
 from resources.lib import kaltura
 from resources.lib import kodi
@@ -46,8 +50,37 @@ from resources.lib import utils
 from resources.lib import yle
 
 
+# Event types, grouped by the action they trigger.
+_REMOTE_LIST_EVENTS = frozenset({"category", "package", "subcategory", "alphabetical", "series", "results"})
+_COMMAND_EVENTS = frozenset({"search", "settings", "clear_cache", "download"})
+_LOCAL_LIST_EVENTS = frozenset({"menu", "channel", "downloads"})
+_PLAY_EVENTS = frozenset({"program", "clip", "video", "live"})
+
+# Number of subcategory listings of a category to fetch before they are selected.
+_PREFETCH_COUNT = 3
+# Number of entries returned by a single api query.
+_PAGE_SIZE = 100
+
+# Action for each event type, called as handler(event_type, params, param_string, locale).
+_EVENT_HANDLERS = {
+    **dict.fromkeys(_REMOTE_LIST_EVENTS,
+                    lambda event_type, params, param_string, locale:
+                    try_cache(param_string, locale) or show_remote_list(event_type, params, param_string, locale)),
+    **dict.fromkeys(_COMMAND_EVENTS,
+                    lambda event_type, params, param_string, locale: do_command(event_type, params)),
+    **dict.fromkeys(_LOCAL_LIST_EVENTS,
+                    lambda event_type, params, param_string, locale: show_local_list(event_type)),
+    **dict.fromkeys(_PLAY_EVENTS,
+                    lambda event_type, params, param_string, locale: play_media(event_type, params, locale)),
+}
+
+
 def addon_areena_main(param_string):
     """ Router function that decides action depending on param_string addon was invoked with. """
+    # Settings may have changed since the previous invocation of the reused interpreter.
+    kodi.reload_addon()
+    reload_debug_setting()
+
     # Parse a URL-encoded param_string to the dictionary of
     # {<parameter>: <value>} elements
     params = dict(parse_qsl(param_string))
@@ -60,22 +93,14 @@ def addon_areena_main(param_string):
         event_type = params.get("type", "")
 
     locale = kodi.get_setting("language")
-    log(f"Performing action: {str(params)}")
-
-    if event_type in ["category", "package", "subcategory", "alphabetical", "series", "results"]:
-        try_cache(param_string, locale) or show_remote_list(event_type, params, param_string, locale)
-
-    elif event_type in ["search", "settings", "clear_cache", "download"]:
-        do_command(event_type, params)
-
-    elif event_type in ["menu", "channel", "downloads"]:
-        show_local_list(event_type)
+    log("Performing action: %s", params)
 
-    elif event_type in ["program", "clip", "video", "live"]:
-        play_media(event_type, params, locale)
+    handler = _EVENT_HANDLERS.get(event_type)
 
+    if handler:
+        handler(event_type, params, param_string, locale)
     else:
-        log(f"Unknown event: {event_type}")
+        log("Unknown event: %s", event_type)
 
 
 def do_command(event_type, params):
@@ -93,6 +118,9 @@ def do_command(event_type, params):
     elif event_type == "settings":
         # Display settings for the addon.
         kodi.open_settings()
+        # Any setting may have been changed by the user.
+        kodi.reload_addon()
+        reload_debug_setting()
 
     elif event_type == "clear_cache":
         # Clears the memory cache of listings.
@@ -109,7 +137,7 @@ def play_media(event_type, params, locale):
         manifest, stream_format = get_live_stream_manifest(yle_id, locale)
         headers = get_http_headers()
 
-    elif event_type in ["program", "clip"]:
+    elif event_type in {"program", "clip"}:
         # Video on demand media.
         manifest, stream_format, _ = get_vod_stream_manifest(yle_id, kaltura_id, "vod")
         headers = get_http_headers()
@@ -127,7 +155,7 @@ def show_local_list(event_type):
     """ Displays a list of content. """
     if event_type == "menu":
         # Addon home screen.
-        content = populate_home_menu()
+        content = populate_home_menu(kodi.get_gui_language())
         # List type should be files, but prevents kodi showing custom icons.
         list_type = ""
 
@@ -146,9 +174,22 @@ def show_local_list(event_type):
 
 def show_remote_list(event_type, params, param_string, locale):
     """ Generates, caches and displays a list of remote content. """
+    content, list_type = get_remote_list(event_type, params, locale)
+
+    log(lambda: f"Content list: {event_type} {json.dumps(content, indent=2)}")
+    cache.add_data(locale + param_string, content, list_type)
+    kodi.create_listing(content, list_type)
+
+    if event_type in {"category", "package", "alphabetical"}:
+        # The listing is displayed: fetch the likely next listings while the user browses it.
+        prefetch_subcategories(content, locale)
+
+
+def get_remote_list(event_type, params, locale):
+    """ Fetches a list of remote content and the kodi content type of the listing. """
     yle_id = params.get("yle_id", "")
 
-    if event_type in ["category", "package"]:
+    if event_type in {"category", "package"}:
         # List of subcategories in the selected category.
         content = get_category(yle_id, locale)
         list_type = "files"
@@ -179,9 +220,50 @@ def show_remote_list(event_type, params, param_string, locale):
         content = get_search_results(yle_id, locale)
         list_type = "videos"
 
-    log(f"Content list: {event_type} {json.dumps(content, indent=2)}")
-    cache.add_data(locale + param_string, content, list_type)
-    kodi.create_listing(content, list_type)
+    return content, list_type
+
+
+def prefetch_subcategories(content, locale):
+    """
+    Speculatively fetches and caches the first subcategory listings of a listing,
+    so the listing is already in the cache if the user selects the subcategory.
+    Only subcategories known to fit in a single api query are fetched.
+    Called after the listing is displayed. The fetches are finished before returning,
+    so no thread outlives the invocation of the addon.
+    """
+    # Subcategories without a count (eg. of a category page) could need any number of queries.
+    subcategories = [api_data for api_data in (item.get("api_data", {}) for item in content)
+                     if api_data.get("type") == "subcategory" and 0 < int(api_data.get("count", 0)) <= _PAGE_SIZE]
+
+    if not subcategories:
+        return
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(lambda api_data: prefetch_subcategory(api_data, locale),
+                          subcategories[:_PREFETCH_COUNT]))
+
+
+def prefetch_subcategory(api_data, locale):
+    """ Fetches and caches the (single query) listing of a subcategory, unless already cached. """
+    # The same parameters the addon is called with when the item is selected.
+    param_string = kodi.create_param_string(api_data)
+
+    if cache.get_data(locale + param_string):
+        return
+
+    offset = int(api_data.get("offset", 0))
+    base_url = yle.get_api_list_url("content", api_data.get("api_tok", ""), locale)
+    url = yle.create_api_query(base_url, int(api_data["count"]), offset)
+
+    try:
+        content, _ = yle.get_query_content(prefetch_url_response(url), locale)
+    except Exception as err:
+        # Failure is not an error for the user, the listing is fetched again when selected.
+        log("Prefetch of %s failed: %s", param_string, err)
+        return
+
+    # Same list type as a subcategory listing from get_remote_list.
+    cache.add_data(locale + param_string, content, "movies")
 
 
 def try_cache(param_string, locale):
@@ -230,29 +312,42 @@ def get_episodes(path, locale):
     res = get_url_response(url)
     token, seasons = yle.get_season_ids(res, show_clips)
 
+    # Fetch all seasons concurrently.
+    urls = [yle.get_api_episodes_url(token, yle_id, locale) for _, yle_id in seasons]
+    responses = get_url_responses(urls)
+
     ctx = []
-    for season_name, yle_id in seasons:
-        url = yle.get_api_episodes_url(token, yle_id, locale)
-        res = get_url_response(url)
-        ctx += yle.get_category_content(res, locale, season_name)
+    ctx_extend = ctx.extend
+    for (season_name, _), res in zip(seasons, responses):
+        ctx_extend(yle.get_category_content(res, locale, season_name))
     return ctx
 
 
 def get_extended_content(base_url, locale, offset, total):
     """ Fetches list of content (series/films or episodes) that requires multiple api calls. """
-    ctx = []
+    if total <= 0:
+        return []
+
+    # The first query also returns the total number of entries available on the server.
+    requested = min(total, _PAGE_SIZE)
+    url = yle.create_api_query(base_url, requested, offset)
+    ctx, count = yle.get_query_content(get_url_response(url), locale)
+    # Remaining entries to request for this category.
+    total = min(total, count) - requested
+    offset += requested
+
+    # Query the remaining pages of (at most) 100 results concurrently.
+    urls = []
     while total > 0:
-        # Number of results to request.
-        requested = min(total, 100)
-        url = yle.create_api_query(base_url, requested, offset)
-        res = get_url_response(url)
-        content, count = yle.get_query_content(res, locale)
-        ctx.extend(content)
-        # Total available remaining entries on the server for this category.
-        total = min(total, count) - requested
-        # Increment the offset by the number of results.
+        requested = min(total, _PAGE_SIZE)
+        urls.append(yle.create_api_query(base_url, requested, offset))
+        total -= requested
         offset += requested
 
+    for res in get_url_responses(urls, max_workers=4):
+        content, _ = yle.get_query_content(res, locale)
+        ctx.extend(content)
+
     return ctx
 
 
@@ -264,8 +359,9 @@ def get_search_results(query, locale):
     return yle.get_category_content(res, locale)
 
 
+@lru_cache(maxsize=1)
 def populate_tv_channels():
-    """ Creates the live tv channel items. """
+    """ Creates the live tv channel items. The items are static, so they are created only once. """
     return [
         mkdict("yle TV1", "live", "622365/yletv1fin", kodi.get_icon_path("tv1.png")),
         mkdict("yle TV2", "live", "622366/yletv2fin", kodi.get_icon_path("tv2.png")),
@@ -275,8 +371,12 @@ def populate_tv_channels():
     ]
 
 
-def populate_home_menu():
-    """ Creates the initial addon menu items. """
+@lru_cache(maxsize=1)
+def populate_home_menu(gui_language):
+    """
+    Creates the initial addon menu items.
+    The items are created once, and again only if the kodi language (of the labels) changes.
+    """
     return [
         mkdict(kodi.localize(33023), "alphabetical"),
         mkdict(kodi.localize(33024), "category"),
@@ -299,16 +399,21 @@ def populate_downloads():
 
 def download_video(manifest, filename, filepath, filesize, subs):
     """ Download a video (and subtitles) directly to the file system. """
-    log(f"Starting download: {filename}.")
+    log("Starting download: %s.", filename)
     kodi.send_notification_download("start", filename)
-    download_file(manifest, filepath, offset=filesize)
 
-    # Download all subs, overwrite/replace if they exist.
-    for subname, url in subs.items():
-        subpath = utils.get_subtitle_filepath(filepath, subname)
-        download_file(url, subpath, offset=0)
+    try:
+        download_file(manifest, filepath, offset=filesize)
+    except BaseException:
+        # Do not leave the empty file created for the download behind.
+        utils.remove_empty_file(filepath)
+        raise
+
+    # Download all subs concurrently, overwrite/replace if they exist.
+    sub_downloads = [(url, utils.get_subtitle_filepath(filepath, subname)) for subname, url in subs.items()]
+    download_files(sub_downloads)
 
-    log(f"Download of {filename} completed successfully.")
+    log("Download of %s completed successfully.", filename)
     kodi.send_notification_download("success", filename)
 
 
@@ -318,8 +423,9 @@ def try_download_video(yle_id, kaltura_id, filename):
 
     # Yle hosted streams not supported for download.
     if stream_format == "hls":
-        log(f"Download of {filename} failed: Stream type not supported for download.")
+        log("Download of %s failed: Stream type not supported for download.", filename)
         kodi.send_notification_download("failed", filename)
+        return
 
     filename, filepath, filesize = utils.get_download_filepath(filename, ext=".mp4")
 
@@ -340,11 +446,11 @@ def get_mpd_stream_manifest(kaltura_id, mode):
     """ Fetches the playable MPD stream manifest url (mpd) from kaltura. """
     url = kaltura.get_api_url("multirequest")
     payload = kaltura.get_api_payload(kaltura_id)
-    res = get_url_response(url, payload)
-    manifest = kaltura.get_hd_mpd_stream_manifest(res, mode)
+    json_data = get_url_response(url, payload).json()
+    manifest = kaltura.get_hd_mpd_stream_manifest(json_data, mode)
     subtitles = None
     if mode == "download":
-        subtitles = kaltura.get_subtitles(res)
+        subtitles = kaltura.get_subtitles(json_data)
 
     return manifest, subtitles
 
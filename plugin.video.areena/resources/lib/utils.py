@@ -34,30 +34,48 @@ from resources.lib.kodi import get_download_path, create_EEXIST_popup, get_user_
 
 def get_local_directory_items(path):
     """ Gets a list of items from a local directory and their full paths. """
-    # The path argument to os.listdir must be bytes
-    # to force the returned value to be bytes.
-    dirpath = path.encode("utf-8", "surrogateescape")
-    dirlist = os.listdir(dirpath)
-    files = [f for f in dirlist if f.endswith(b".mp4")]
-    filepaths = [os.path.join(dirpath, fname) for fname in files]
-
-    return [(x.decode("utf-8", "surrogateescape"), y.decode("utf-8", "surrogateescape"))
-            for (x, y) in zip(files, filepaths)]
+    # The path argument to os.scandir must be bytes
+    # to force the returned entry names and paths to be bytes.
+    with os.scandir(path.encode("utf-8", "surrogateescape")) as entries:
+        return [(entry.name.decode("utf-8", "surrogateescape"), entry.path.decode("utf-8", "surrogateescape"))
+                for entry in entries if entry.name.endswith(b".mp4") and entry.is_file()]
 
 
 def get_subtitle_filepath(filepath, subext):
     """ Formats the path to save the subtitle file to and deletes file if it exists. """
-    # Extract basename and path.
-    path, file = os.path.split(filepath.encode("utf-8", "surrogateescape"))
-    # Remove file extension.
-    fname, _ = os.path.splitext(file)
-    # Append subtitle extension.
-    subpath = os.path.join(path, fname + subext.encode("utf-8", "surrogateescape"))
+    # Replace the file extension with the subtitle extension.
+    subpath = os.path.splitext(filepath)[0] + subext
+    subpath_bytes = subpath.encode("utf-8", "surrogateescape")
+
+    if os.path.isfile(subpath_bytes):
+        os.remove(subpath_bytes)
+
+    return subpath
+
+
+def create_new_file(filepath):
+    """
+    Creates an empty file at filepath, unless the file already exists.
+    The existence check and creation are atomic, so concurrent downloads can not claim the same file.
+    Returns True if the file was created.
+    """
+    try:
+        os.close(os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+    except FileExistsError:
+        return False
+
+    return True
 
-    if os.path.isfile(subpath):
-        os.remove(subpath)
 
-    return subpath.decode("utf-8", "surrogateescape")
+def remove_empty_file(filepath):
+    """ Removes the file at filepath if it is empty, eg. created for a download that failed. """
+    filepath_bytes = filepath.encode("utf-8", "surrogateescape")
+
+    try:
+        if os.path.getsize(filepath_bytes) == 0:
+            os.remove(filepath_bytes)
+    except OSError:
+        pass
 
 
 def get_download_filepath(title, ext):
@@ -72,8 +90,8 @@ def get_download_filepath(title, ext):
     filename = (title + ext).replace("/", ":")
     filepath = os.path.join(target_dir, filename.encode("utf-8", "surrogateescape"))
 
-    # Loop while suggested target filename exists.
-    while os.path.isfile(filepath):
+    # Create the suggested target file, looping while the filename already exists.
+    while not create_new_file(filepath):
         # Ask user how to proceed with existing file.
         user_choice = create_EEXIST_popup(filename)
 
@@ -83,7 +101,7 @@ def get_download_filepath(title, ext):
 
         if user_choice == "replace":
             os.remove(filepath)
-            break
+            continue
 
         if user_choice == "resume":
             # Calculate the file size to use for resume offset writes.
@@ -20,22 +20,75 @@ The api_data is used to create url requests for stream manifests.
 
 """
 import json
+import re
 
 from resources.lib.logger import log
 from resources.lib.misc import extract_suffix, get_duration_seconds, kwdict
 from resources.lib.gazpacho import Soup
 
+_BASE_URL = {"fi": "https://areena.yle.fi",
+             "sv": "https://arenan.yle.fi"}
+
+_PACKAGE_PATH = {"fi": "/tv/ohjelmat/",
+                 "sv": "/tv/program/"}
+
+# Artwork image url: formatted with the image version and id.
+_IMG_TEMPLATE = ("https://images.cdn.yle.fi/image/upload/"
+                 "ar_16:9,w_720,c_fit,d_yle-areena.jpg,f_auto,fl_lossy,q_auto:eco/"
+                 "v%s/%s.jpg")
+
+# Constant parts of the yle api query strings: api version and app credentials.
+_LIVE_QUERY = "v=9&app_id=player_static_prod&app_key=8930d72170e48303cf5f3867780d549b"
+
+_STREAM_QUERY = ("language=fin&ssl=true&countryCode=FI&host=areenaylefi"
+                 "&app_id=player_static_prod&app_key=8930d72170e48303cf5f3867780d549b")
+
+_LIST_QUERY = "v=9&app_id=areena_web_personal_prod&app_key=6c64d890124735033c50099ca25dd2fe"
+
+_EPISODES_QUERY = ("v=9&client=yle-areena-web&"
+                   "app_id=areena-web-items&app_key=v9No1mV0omg2BppmDkmDL6tGKw1pRFZt")
+
+_SEARCH_QUERY = ("app_id=areena_web_frontend_prod&app_key=4622a8f8505bb056c956832a70c105d4&"
+                 "client=yle-areena-web")
+
+# Stream media host (the media_id prefix) to the function returning the kaltura id.
+_MEDIA_HOST_HANDLERS = {
+    # Kaltura
+    "29": lambda media_info: media_info[1],
+    # yleawodamd.akamaized.net, yleawsmpodamdip4v
+    "55": lambda media_info: "",
+    "67": lambda media_info: "",
+}
+
+# Language specific api tokens to access the alphabetical categories.
+_ALPHA_TOKENS = {
+    "fi": ("eyJhbGciOiJIUzI1NiJ9.eyJzb3VyY2UiOiJodHRwczovL3BhY2thZ2VzLmFwaS55bGUuZmkvdjQvcGFja2Fn"
+           "ZXMvMzAtNDg4L2FvLmpzb24_Z3JvdXBpbmc9dGl0bGUuZmkmbGFuZ3VhZ2U9ZmkiLCJwcmVzZW50YXRpb25Pd"
+           "mVycmlkZSI6Imxpc3RDYXJkIiwiYW5hbHl0aWNzIjp7ImNvbnRleHQiOnsiY29tc2NvcmUiOnsieWxlX3JlZm"
+           "VyZXIiOiJ0di52aWV3LjU3LVJ5eUpud2I5Yi5rYWlra2lfdHZfb2hqZWxtYXQuYV9vLnVudGl0bGVkX2xpc3Q"
+           "iLCJ5bGVfcGFja2FnZV9pZCI6IjMwLTQ4OCJ9fX19.3aS55Qzc98NXw3s_05dwspnKO5uKWktr8FYaDOzo1P0"),
+
+    "sv": ("eyJhbGciOiJIUzI1NiJ9.eyJzb3VyY2UiOiJodHRwczovL3Byb2dyYW1zLmFwaS55bGUuZmkvdjMvc2NoZW1hL"
+           "3YxL3BhY2thZ2VzLzMwLTQ4OC9hbz9ncm91cGluZz10aXRsZS5zdiZsYW5ndWFnZT1zdiIsInByZXNlbnRhdGl"
+           "vbk92ZXJyaWRlIjoibGlzdENhcmQiLCJhbmFseXRpY3MiOnsiY29udGV4dCI6eyJjb21zY29yZSI6eyJ5bGVfc"
+           "mVmZXJlciI6InR2LnZpZXcuNTctUnl5Sm53YjliLmFsbGFfdHZfcHJvZ3JhbS5hX28udW50aXRsZWRfbGlzdCI"
+           "sInlsZV9wYWNrYWdlX2lkIjoiMzAtNDg4In19fX0.v4kayxYaMtPxseJCAKrueSHwNca7nVmvjECwMdhQMkQ")
+}
+
+# Listed order of the alphabetical categories: category name to sort position.
+_ALPHABET_ORDER = {name: index for index, name in enumerate(
+    ["0-9","A","À","B","C","D","E","F","G","H","I","J","K","L","M","N","O",
+     "P","Q","R","S","T","Þ","U","V","W","X","Y","Z","Ž","Å","Ä","Ö"])}
+
 
 def get_base_url(locale):
     """ Get the base yle areena url for Finnish or Swedish, based on language settings. """
-    return {"fi": "https://areena.yle.fi",
-            "sv": "https://arenan.yle.fi"}.get(locale)
+    return _BASE_URL.get(locale)
 
 
 def get_package_path(locale):
     """ Gets the path for package/series content. eg yle.areena.fi/tv/ohjelmat/12345"""
-    return {"fi": "/tv/ohjelmat/",
-            "sv": "/tv/program/"}.get(locale)
+    return _PACKAGE_PATH.get(locale)
 
 
 def get_live_tv_url(media_id):
@@ -45,90 +98,95 @@ def get_live_tv_url(media_id):
 
 def get_image_url(_version, _id):
     """ constructs artwork image url for a series/episode/movie item. """
-    return (f"https://images.cdn.yle.fi/image/upload/"
-            f"ar_16:9,w_720,c_fit,d_yle-areena.jpg,f_auto,fl_lossy,q_auto:eco/"
-            f"v{_version}/{_id}.jpg")
+    return _IMG_TEMPLATE % (_version, _id)
 
 
 def get_api_live_url(media_id, language):
     """ Constructs yle api live stream url for a supplied media_id. """
-    return (f"https://areena.api.yle.fi/v1/ui/players/{media_id}.json?"
-            f"language={language}&"
-            f"v=9&"
-            f"app_id=player_static_prod&"
-            f"app_key=8930d72170e48303cf5f3867780d549b")
+    return f"https://areena.api.yle.fi/v1/ui/players/{media_id}.json?language={language}&{_LIVE_QUERY}"
 
 
 def get_api_stream_url(media_id):
     """ Constructs yle api stream preview url for a supplied media_id. """
-    return (f"https://player.api.yle.fi/v1/preview/{media_id}.json?"
-            f"language=fin&"
-            f"ssl=true&"
-            f"countryCode=FI&"
-            f"host=areenaylefi"
-            f"&app_id=player_static_prod"
-            f"&app_key=8930d72170e48303cf5f3867780d549b")
+    return f"https://player.api.yle.fi/v1/preview/{media_id}.json?{_STREAM_QUERY}"
 
 
 def get_api_list_url(content_or_packages, token, language):
     """ Constructs yle api query with supplied token (signed jwt specifying the query). """
     return (f"https://areena.api.yle.fi/v1/ui/{content_or_packages}/list?"
-            f"token={token}&"
-            f"language={language}&"
-            f"v=9&"
-            f"app_id=areena_web_personal_prod&"
-            f"app_key=6c64d890124735033c50099ca25dd2fe")
+            f"token={token}&language={language}&{_LIST_QUERY}")
 
 
 def get_api_episodes_url(token, yle_id, language):
     """ Constructs yle api query with supplied token (signed jwt specifying the query). """
     return (f"https://areena.api.yle.fi/v1/ui/content/list?"
-            f"token={token}&"
-            f"path.season={yle_id}&"
-            f"language={language}&"
-            f"v=9&"
-            f"client=yle-areena-web&"
-            f"app_id=areena-web-items&"
-            f"app_key=v9No1mV0omg2BppmDkmDL6tGKw1pRFZt")
+            f"token={token}&path.season={yle_id}&language={language}&{_EPISODES_QUERY}")
 
 
 def get_api_search_url(query, language):
     """ Constructs yle api url for a supplied search query. """
-    return (f"https://areena.api.yle.fi/v1/ui/search?"
-            f"app_id=areena_web_frontend_prod&"
-            f"app_key=4622a8f8505bb056c956832a70c105d4&"
-            f"client=yle-areena-web&"
-            f"language={language}&"
-            f"v=9&"
-            f"episodes=true&"
-            f"packages=true&"
-            f"query={query}&"
-            f"service=tv&"
-            f"offset=0&limit=999")
+    return (f"https://areena.api.yle.fi/v1/ui/search?{_SEARCH_QUERY}&"
+            f"language={language}&v=9&episodes=true&packages=true&"
+            f"query={query}&service=tv&offset=0&limit=999")
 
 
 def get_api_alphabetical_token(locale):
     """ Returns language specific api token to access alphabetical categories. """
-    return {
-    "fi": ("eyJhbGciOiJIUzI1NiJ9.eyJzb3VyY2UiOiJodHRwczovL3BhY2thZ2VzLmFwaS55bGUuZmkvdjQvcGFja2Fn"
-           "ZXMvMzAtNDg4L2FvLmpzb24_Z3JvdXBpbmc9dGl0bGUuZmkmbGFuZ3VhZ2U9ZmkiLCJwcmVzZW50YXRpb25Pd"
-           "mVycmlkZSI6Imxpc3RDYXJkIiwiYW5hbHl0aWNzIjp7ImNvbnRleHQiOnsiY29tc2NvcmUiOnsieWxlX3JlZm"
-           "VyZXIiOiJ0di52aWV3LjU3LVJ5eUpud2I5Yi5rYWlra2lfdHZfb2hqZWxtYXQuYV9vLnVudGl0bGVkX2xpc3Q"
-           "iLCJ5bGVfcGFja2FnZV9pZCI6IjMwLTQ4OCJ9fX19.3aS55Qzc98NXw3s_05dwspnKO5uKWktr8FYaDOzo1P0"),
+    return _ALPHA_TOKENS.get(locale)
 
-    "sv": ("eyJhbGciOiJIUzI1NiJ9.eyJzb3VyY2UiOiJodHRwczovL3Byb2dyYW1zLmFwaS55bGUuZmkvdjMvc2NoZW1hL"
-           "3YxL3BhY2thZ2VzLzMwLTQ4OC9hbz9ncm91cGluZz10aXRsZS5zdiZsYW5ndWFnZT1zdiIsInByZXNlbnRhdGl"
-           "vbk92ZXJyaWRlIjoibGlzdENhcmQiLCJhbmFseXRpY3MiOnsiY29udGV4dCI6eyJjb21zY29yZSI6eyJ5bGVfc"
-           "mVmZXJlciI6InR2LnZpZXcuNTctUnl5Sm53YjliLmFsbGFfdHZfcHJvZ3JhbS5hX28udW50aXRsZWRfbGlzdCI"
-           "sInlsZV9wYWNrYWdlX2lkIjoiMzAtNDg4In19fX0.v4kayxYaMtPxseJCAKrueSHwNca7nVmvjECwMdhQMkQ")
-            }.get(locale)
+
+def find_element(html, tag, attrs, marker):
+    """
+    Finds the first tag element with matching attrs in the html.
+    Parsing a whole web page with gazpacho is slow, so only the html from the start of
+    the tag containing marker (eg. a unique attribute) to its first closing tag is parsed.
+    Falls back to parsing the whole page if that does not contain the element.
+    """
+    marker_pos = html.find(marker)
+
+    if marker_pos != -1:
+        start = html.rfind(f"<{tag}", 0, marker_pos)
+        end = html.find(f"</{tag}>", marker_pos)
+
+        if -1 not in (start, end):
+            element = Soup(html[start:end + len(tag) + 3]).find(tag, attrs, mode="first")
+            if element:
+                return element
+
+    return Soup(html).find(tag, attrs, mode="first")
+
+
+def find_all_elements(html, tag, attrs, marker):
+    """
+    Finds all tag elements with matching attrs in the html.
+    Like find_element, only the html from the tag containing the first marker
+    to the closing tag following the last marker is parsed.
+    Falls back to parsing the whole page if the tags of that html do not balance.
+    """
+    first_pos = html.find(marker)
+
+    if first_pos != -1:
+        start = html.rfind(f"<{tag}", 0, first_pos)
+        end = html.find(f"</{tag}>", html.rfind(marker))
+
+        if -1 not in (start, end):
+            fragment = html[start:end + len(tag) + 3]
+            opened = len(re.findall(f"<{tag}[\\s>]", fragment))
+
+            # A nested tag element ends the fragment early, leaving its tags unbalanced.
+            if opened == fragment.count(f"</{tag}>"):
+                elements = Soup(fragment).find(tag, attrs, mode="all")
+                if elements:
+                    return elements
+
+    return Soup(html).find(tag, attrs, mode="all") or []
 
 
 def get_root_categories(site):
     """ Scrapes the yle areena home page menu bar for a list of categories. """
     categories = []
-    soup = Soup(site.text).find("li", {"class": "menu__item"})
-    menu_items = [x.find("a") for x in soup]
+    soup = find_all_elements(site.text, "li", {"class": "menu__item"}, 'class="menu__item')
+    menu_items = [x.find("a", mode="first") for x in soup]
 
     _type = "category"
 
@@ -150,7 +208,7 @@ def get_root_categories(site):
 def get_sub_categories(site):
     """ Scrapes the yle areena category page for JSON and extracts a list of subcategories. """
     categories = []
-    soup = Soup(site.text).find("div", {"class": "package-view"}).attrs.get("data-view")
+    soup = find_element(site.text, "div", {"class": "package-view"}, 'class="package-view').attrs.get("data-view")
     json_data = json.loads(soup)["tabs"][0]["content"]
 
     _type = "subcategory"
@@ -172,14 +230,17 @@ def get_sub_categories(site):
 
 def get_season_ids(site, show_clips):
     """ Scrapes the yle areena season page for JSON and extracts a list of season ids and content link. """
-    soup = Soup(site.text).find("script", {"id": "__NEXT_DATA__"})
+    soup = find_element(site.text, "script", {"id": "__NEXT_DATA__"}, 'id="__NEXT_DATA__"')
     json_data = json.loads(soup.text)
 
-    jwt_url = json_data['props']['pageProps']['view']['tabs'][0]['content'][0]['source']['uri']
+    # The season list and its api token are both stored in the first content of the first tab.
+    tab_content = json_data['props']['pageProps']['view']['tabs'][0]['content'][0]
+
+    jwt_url = tab_content['source']['uri']
     api_tok = extract_token(jwt_url)
     api_tok = api_tok[:api_tok.rfind("&path")]
 
-    seasons = json_data['props']['pageProps']['view']['tabs'][0]['content'][0]['filters']
+    seasons = tab_content['filters']
     payload = []
 
     if seasons:
@@ -203,10 +264,8 @@ def sort_alphabetical_categories(categories):
     listed order: A-Z,À,Ä,Å,Ö,Þ,Ž
     stored order: A-T,Þ,U-Z,Ž,Å,Ä,Ö
     """
-    alphabet = ["0-9","A","À","B","C","D","E","F","G","H","I","J","K","L","M","N","O",
-                  "P","Q","R","S","T","Þ","U","V","W","X","Y","Z","Ž","Å","Ä","Ö"]
-    # Sort the list of dictionaries by their "name" value, using the provided sort ordering.
-    sorted_categories = sorted(categories, key=lambda entry: alphabet.index(entry["name"]))
+    # Sort the list of dictionaries by their "name" value, using the listed sort ordering.
+    sorted_categories = sorted(categories, key=lambda entry: _ALPHABET_ORDER[entry["name"]])
     offset = 0
 
     for item in sorted_categories:
@@ -223,7 +282,7 @@ def get_alphabetical_categories(site, locale):
     """ Parses JSON for a list of alphabetical categories and the number of items per category. """
     categories = []
     json_data = site.json()["meta"]["resultGroups"]
-    log(f"Alphabetical content: {json.dumps(json_data, indent=2)}")
+    log(lambda: f"Alphabetical content: {json.dumps(json_data, indent=2)}")
 
     _type = "subcategory"
     _id = "-"
@@ -242,20 +301,26 @@ def get_alphabetical_categories(site, locale):
 
 def get_category_content(site, locale, title_prefix=None):
     """ Extracts all media (programs and series lists) from the yle API JSON response. """
+    return parse_category_content(site.json()["data"], locale, title_prefix)
+
+
+def parse_category_content(json_data, locale, title_prefix=None):
+    """ Extracts all media (programs and series lists) from the decoded yle API JSON data. """
     content = []
-    json_data = site.json()["data"]
-    log(f"Category content: {json.dumps(json_data, indent=2)}")
+    log(lambda: f"Category content: {json.dumps(json_data, indent=2)}")
     title_prefix = title_prefix or ""
+    package_path = get_package_path(locale)
 
     for entry in json_data:
+        pointer = entry.get("pointer", {})
         _name = entry.get("title", "")
-        _type = entry.get("pointer", {}).get("type", "")
-        _id = entry.get("pointer", {}).get("uri", "").split("/")[-1]
+        _type = pointer.get("type", "")
+        _id = pointer.get("uri", "").rpartition("/")[2]
         _description = entry.get("description", "")
 
         # Packages require additional scraping, so the full path is needed.
         if _type == "package":
-            _id = get_package_path(locale) + _id
+            _id = package_path + _id
 
         try:
             _image = get_image_url(entry["image"]["version"], entry["image"]["id"])
@@ -285,19 +350,21 @@ def create_api_query(url, limit, offset):
 
 def get_query_content(res, locale):
     """ Parses response for appropriate content and returns the total number of items available. """
-    content = get_category_content(res, locale)
-    count = res.json()["meta"]["count"]
+    # Decode the response once for both the content and the count.
+    json_data = res.json()
+    content = parse_category_content(json_data["data"], locale)
+    count = json_data["meta"]["count"]
 
     return (content, count)
 
 
 def extract_duration_timestamp(json_data):
     """ Find and parse the duration timestamp stored in inconsistent locations in the JSON. """
-    timestamp = (i.get("raw") for i in json_data if i.get("rawType") == "duration")
-    try:
-        return get_duration_seconds(next(timestamp))
-    except StopIteration:
-        return ""
+    for label in json_data:
+        if label.get("rawType") == "duration":
+            return get_duration_seconds(label.get("raw"))
+
+    return ""
 
 
 def extract_token(url):
@@ -320,27 +387,20 @@ def get_kaltura_id_or_none(media_data):
     if not media_data:
         return ""
 
-    media_info = media_data.split("-")
-    media_host = media_info[0]
-
-    # Kaltura
-    if media_host == "29":
-        media_id = media_info[1]
+    media_info = media_data.split("-", 1)
+    handler = _MEDIA_HOST_HANDLERS.get(media_info[0])
 
-    # yleawodamd.akamaized.net, yleawsmpodamdip4v
-    elif media_host in ["55", "67"]:
-        media_id = ""
-
-    else:
-        # Raise an error for media_id is unreferenced to learn the new type.
-        log(f"Unknown stream media type: {media_data}")
+    if handler is None:
+        log("Unknown stream media type: %s", media_data)
+        return ""
 
-    return media_id
+    return handler(media_info)
 
 
 def get_stream_manifest(site):
     """ Extracts the media_id and stream manifest from the yle api json response. """
-    json_data = site.json()["data"].get("ongoing_ondemand", {}) or site.json()["data"].get("ongoing_event", {})
+    json_data = site.json()["data"]
+    json_data = json_data.get("ongoing_ondemand") or json_data.get("ongoing_event") or {}
     manifest_url = json_data.get("manifest_url")
     media_data = json_data.get("media_id")
     return manifest_url, get_kaltura_id_or_none(media_data)
@@ -348,5 +408,6 @@ def get_stream_manifest(site):
 
 def get_live_stream_media_id(site):
     """ Extracts the media_id for a live stream from the yle api json response. """
-    log(f"Live stream: {json.dumps(site.json(), indent=2)}")
-    return site.json()["data"]["live"]["item"]["id"]
+    json_data = site.json()
+    log(lambda: f"Live stream: {json.dumps(json_data, indent=2)}")
+    return json_data["data"]["live"]["item"]["id"]